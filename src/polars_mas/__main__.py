@@ -0,0 +1,4 @@
+from polars_mas._bootstrap import main
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+import argparse
+import os
+import sys
+
+from loguru import logger
+from pathlib import Path
+
+
+def main() -> None:
+    """
+    Entry point of the polars-mas CLI.
+
+    Polars and numba size their thread pools when they are first imported, so the arguments are
+    parsed and the thread counts exported before the CLI module (and with it polars, numba and the
+    polars_mas namespaces) is imported. The remaining validation happens in polars_mas.cli.
+    """
+    args = _build_parser().parse_args()
+    setup_logger(args.output, args.verbose)
+    _limit_threads(args)
+    os.environ["POLARS_MAX_THREADS"] = str(args.polars_threads)
+    os.environ["NUMBA_NUM_THREADS"] = str(args.threads)
+    from polars_mas.cli import multiple_association_study
+
+    multiple_association_study(args)
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Polars-MAS: A Python package for multiple association analysis."
+    )
+    parser.add_argument("-i", "--input", required=True, type=Path, help="Input file path.")
+    parser.add_argument("-o", "--output", required=True, type=Path, help="Output file prefix. Will be suffixed with '{predictor}.csv'.")
+    parser.add_argument(
+        "-p",
+        "--predictors",
+        required=True,
+        type=str,
+        nargs="+",
+        help="Predictor column names. These will be tested independently",
+    )
+    parser.add_argument(
+        "-s",
+        "--separator",
+        type=str,
+        help='Column separator. Default is ","',
+        default=",",
+    )
+    # Column selection arguments
+    parser.add_argument(
+        "-d",
+        "--dependents",
+        type=str,
+        nargs="+",
+        help="Dependent variable column names.",
+        default=None,
+    )
+    parser.add_argument(
+        "-di",
+        "--dependents-indices",
+        type=str,
+        help="""Dependent variable column indicies. Ignored if --dependents is used.
+        Accepts comma separated list of indices/indicies ranges. E.g. 2, 2-5, 2-, 2,3 , 2,5-8, 2,8- are all valid.
+        Range follows python slicing conventions - includes start, excludes end.""",
+        default=None,
+    )
+    parser.add_argument(
+        "-c",
+        "--covariates",
+        type=str,
+        nargs="+",
+        help="Covariate column names.",
+        default=None,
+    )
+    parser.add_argument(
+        "-ci",
+        "--covariates-indicies",
+        type=str,
+        help="""Covariate column indicies. Ignored if --covariates is used.
+        Accepts comma separated list of indices/indicies ranges. E.g. 2, 2-5, 2-, 2,3 , 2,5-8, 2,8- are all valid.
+        Range follows python slicing conventions - includes start, excludes end.""",
+        default=None,
+    )
+    parser.add_argument(
+        "-cc",
+        "--categorical-covariates",
+        type=str,
+        nargs="+",
+        help="Categorical covariate column names.",
+        default=None,
+    )
+    parser.add_argument(
+        "-nv",
+        "--null-values",
+        type=str,
+        nargs="+",
+        help="List of values to be treated as missing values. Default is None (normal polars option).",
+        default=None,
+    )
+    # Test parameter arguments
+    parser.add_argument(
+        "-qt",
+        "--quantitative",
+        action="store_true",
+        help="Dependent variables are quantitative traits.",
+    )
+    parser.add_argument(
+        "-m",
+        "--missing",
+        type=str,
+        choices=["drop", "forward", "backward", "min", "max", "mean", "zero", "one"],
+        help="Method to handle missing values in covariates and predictor variables. If not specified, rows with missing values in the predictor and covariate columns will be dropped.",
+        default="drop",
+    )
+    parser.add_argument(
+        "-t",
+        "--transform",
+        type=str,
+        choices=["standard", "min-max"],
+        help="Transform continuous covariates/predictor variables. Default is no transformation.",
+        default=None,
+    )
+    parser.add_argument(
+        "-mc",
+        "--min-cases",
+        type=int,
+        help="Minimum number of cases and controls for each dependent variable (measurements when --quantitative). Default is 20.",
+        default=20,
+    )
+    parser.add_argument(
+        "-lm",
+        "--linear-model",
+        type=str,
+        choices=["lm", "glm"],
+        help="Type of linear model to fit. Default is lm.",
+        default="lm",
+    )
+    parser.add_argument(
+        "-bm",
+        "--binary-model",
+        type=str,
+        choices=["firth", "logistic"],
+        help="Type of binary model to fit. Default is firth logistic regression.",
+        default="firth",
+    )
+    parser.add_argument(
+        "--phewas",
+        action="store_true",
+        help="Input data uses Phecodes for dependent variables.",
+    )
+    parser.add_argument(
+        "--phewas-sex-col",
+        type=str,
+        help="Sex covariate column name for PheWAS analysis. Default = 'sex'. Must be coded as male = 0 and female = 1.",
+        default="sex",
+    )
+    # Stuff for polars and numpy
+    parser.add_argument(
+        "-fr",
+        "--frame-type",
+        type=str,
+        choices=["lazy"],
+        help="Deprecated and ignored, input is always read lazily.",
+        default=None,
+    )
+    parser.add_argument(
+        "-th",
+        "--threads",
+        type=int,
+        help="Number of threads for the regression kernels to use. Defaults to the number of Polars threads.",
+        default=None,
+    )
+    parser.add_argument(
+        "-pt",
+        "--polars-threads",
+        type=int,
+        help="Number of threads for polars to use. Defaults to all threads on machine.",
+        default=os.cpu_count(),
+    )
+    parser.add_argument("-v", "--verbose", action="store_true", help="have more verbose logging")
+    return parser
+
+
+def _limit_threads(args: argparse.Namespace) -> None:
+    # Check that threads <= polars_threads and that polars_threads <= os.cpu_count()
+    if args.polars_threads > os.cpu_count():
+        logger.warning(
+            f"Number of Polars threads ({args.polars_threads}) exceeds number of available CPUs ({os.cpu_count()}). Setting Polars threads to {os.cpu_count()}."
+        )
+        args.polars_threads = os.cpu_count()
+    if args.threads is None:
+        args.threads = args.polars_threads
+    elif args.threads > args.polars_threads:
+        logger.warning(
+            f"Number of computation threads ({args.threads}) exceeds number of Polars threads ({args.polars_threads}). Setting threads to {args.polars_threads}."
+        )
+        args.threads = args.polars_threads
+
+
+def setup_logger(output: Path, verbose: bool):
+    logger.remove()
+
+    log_file_path = output.with_suffix(".log")
+    if log_file_path.exists():
+        log_file_path.unlink()
+    logger.add(
+        log_file_path,
+        format="{time: DD-MM-YYYY -> HH:mm} | {level} | {message}",
+        level="INFO",
+        enqueue=True,
+    )
+    if verbose:
+        stdout_level = "DEBUG"
+        stderr_level = "WARNING"
+    else:
+        stdout_level = "INFO"
+        stderr_level = "ERROR"
+
+    logger.add(
+        sys.stdout,
+        colorize=True,
+        format="<green>{time: DD-MM-YYYY -> HH:mm:ss}</green> <level>{message}</level>",
+        level=stdout_level,
+        filter=lambda record: record["level"].name not in ["WARNING", "ERROR"],
+        enqueue=True,
+    )
+    logger.add(
+        sys.stderr,
+        colorize=True,
+        format="<red>{time: DD-MM-YYYY -> HH:mm:ss}</red> <level>{message}</level>",
+        level=stderr_level,
+        filter=lambda record: record["level"].name not in ["DEBUG", "INFO", "SUCCESS"],
+        enqueue=True,
+    )
@@ -0,0 +1,103 @@
+import re
+import argparse
+
+from loguru import logger
+from pathlib import Path
+from threadpoolctl import threadpool_limits
+from itertools import chain
+
+from polars_mas.main import run_mas
+
+
+def multiple_association_study(args: argparse.Namespace) -> None:
+    """Validate the parsed arguments and run the associations, see polars_mas._bootstrap.main."""
+    _validate_args(args)
+    # BLAS stays single threaded, the regression kernels own the parallelism over dependents
+    threadpool_limits(limits=1, user_api="blas")
+    # Run Aurora
+    run_mas(**vars(args))
+
+
+def _validate_args(args):
+    if not args.input.exists():
+        raise FileNotFoundError(f"File not found: {args.input}")
+    if not args.output.parent.exists():
+        raise FileNotFoundError(f"Output directory not found: {args.output.parent}")
+    # Load in the header of the input file to check passed columns
+    file_col_names = _load_input_header(args.input, args.separator)
+    logger.info(f"{len(file_col_names)} columns found in input file.")
+    # Check predictor
+    if any([predictor not in file_col_names for predictor in args.predictors]):
+        raise ValueError(f"Predictor column '{args.predictors}' not found in input columns.")
+
+    # Check dependents
+    if args.dependents:
+        for dep in args.dependents:
+            if dep not in file_col_names:
+                raise ValueError(f"Dependent column '{dep}' not found in input file.")
+    elif args.dependents_indices:
+        args.dependents = _match_columns_to_indices(args.dependents_indices, file_col_names)
+    else:
+        raise ValueError("No dependent variables specified.")
+
+    # Check covariates
+    if args.covariates:
+        for cov in args.covariates:
+            if cov not in file_col_names:
+                raise ValueError(f"Covariate column '{cov}' not found in input file.")
+    elif args.covariates_indicies:
+        args.covariates = _match_columns_to_indices(args.covariates_indicies, file_col_names)
+    else:
+        args.covariates = []
+
+    ## Check categorical covariates
+    if args.categorical_covariates and not args.covariates:
+        raise ValueError("Categorical covariates specified without specifying covariates")
+    elif args.categorical_covariates:
+        for cov in args.categorical_covariates:
+            if cov not in args.covariates:
+                raise ValueError(
+                    f"Categorical covariate column '{cov}' not found in given covariates: {args.covariates}."
+                )
+    else:
+        args.categorical_covariates = []
+
+    if args.frame_type is not None:
+        logger.warning("--frame-type is deprecated and ignored, input is always read lazily.")
+
+
+########### Validation functions ############
+# A single column index or a range, 'start-end' or 'start-' for all remaining columns
+_IDX_RE = re.compile(r"^(\d+)(?:-(\d*))?$")
+
+
+def _load_input_header(input_file: Path, separator: str) -> list[str]:
+    with input_file.open() as f:
+        return f.readline().strip().split(separator)
+
+
+def _match_columns_to_indices(indices: str, col_names: list[str]) -> list[str]:
+    slices = []
+    for token in indices.split(","):
+        if "" == token:
+            continue
+        match = _IDX_RE.match(token)
+        if match is None:
+            raise ValueError(f"Invalid index format, must use '-' for a range: {token}")
+        start, end = match.groups()
+        start_idx = int(start)
+        if end is None:
+            if start_idx >= len(col_names):
+                raise ValueError(f"Index {start_idx} out of range for {len(col_names)} columns in input file.")
+            slices.append(slice(start_idx, start_idx + 1))
+            continue
+        if start_idx >= len(col_names):
+            raise ValueError(
+                f"Start index {start_idx} out of range for input file column indices. {len(col_names)} columns found."
+            )
+        if end != "" and int(end) >= len(col_names):
+            raise ValueError(
+                f"End index {end} out of range for {len(col_names)} columns. If you want to use all remaining columns, use {start_idx}-."
+            )
+        slices.append(slice(start_idx, int(end) if end != "" else None))
+    return list(chain.from_iterable(col_names[s] for s in slices))
@@ -13,7 +13,6 @@ def run_mas(
     covariates: list[str],
     categorical_covariates: list[str],
     null_values: list[str],
-    frame_type: str,
     missing: str,
     quantitative: bool,
     transform: str,
@@ -22,15 +21,21 @@ def run_mas(
     binary_model: str,
     **kwargs,
 ) -> None:
-    if frame_type == "eager":
-        reader = pl.read_csv
-    elif frame_type == "lazy":
-        reader = pl.scan_csv
-    df = reader(input, separator=separator, null_values=null_values)
+    # Dependents are parsed as floats so binary codes written as 0.0/1.0 still parse, binary ones
+    # become booleans once validated. The select is pushed down so only the used columns are parsed
+    df = pl.scan_csv(
+        input,
+        separator=separator,
+        null_values=null_values,
+        schema_overrides={dependent: pl.Float32 for dependent in dependents},
+    )
     selected_columns = predictors + covariates + dependents
     independents = predictors + covariates
     preprocessed = (
         df.select(selected_columns)
+        # Sex specific dependents are masked (or dropped) first, so the dependent checks and every
+        # later step only see the kept values and the raw sex coding
+        .polars_mas.phewas_filter(kwargs["phewas"], kwargs["phewas_sex_col"], dependents, drop=True)
         # preprocessing methods
         .polars_mas.check_independents_for_constants(independents)
         .polars_mas.validate_dependents(dependents, quantitative, min_cases)
@@ -39,12 +44,11 @@ def run_mas(
             categorical_covariates, predictors, independents, covariates, dependents
         )
         .polars_mas.transform_continuous(transform, independents, categorical_covariates)
-        # Make long format for dependent variables and remove missing values
-        .polars_mas.melt(predictors, independents, dependents)
-        .polars_mas.phewas_filter(kwargs["phewas"], kwargs["phewas_sex_col"], drop=True)
     )
     assoc_kwargs = {
+        "predictors": predictors,
         "independents": independents,
+        "dependents": dependents,
         "quantitative": quantitative,
         "binary_model": binary_model,
         "linear_model": linear_model,
@@ -1,12 +1,17 @@
+import numpy as np
 import polars as pl
 import time
 
-from functools import partial
 from pathlib import Path
 
 from loguru import logger
 from polars_mas.consts import male_specific_codes, female_specific_codes, phecode_defs
-from polars_mas.model_funcs import polars_firth_regression
+from polars_mas.model_funcs import (
+    FailureCollector,
+    firth_result_schema,
+    no_samples_results,
+    polars_firth_regression,
+)
 
 
 @pl.api.register_dataframe_namespace("polars_mas")
@@ -15,7 +20,7 @@ class MASFrame:
     def __init__(self, df: pl.DataFrame | pl.LazyFrame) -> None:
         self._df = df
 
-    def check_independents_for_constants(self, independents, drop=False) -> pl.DataFrame | pl.LazyFrame:
+    def check_independents_for_constants(self, independents, drop=False) -> pl.LazyFrame:
         """
         Check for constant columns in the given independents and optionally drop them.
 
@@ -33,32 +38,20 @@ class MASFrame:
                            adds an additional log if columns are dropped.
 
         Returns:
-            pl.DataFrame | pl.LazyFrame: The DataFrame with constant columns dropped if `drop` is True,
-                                         otherwise the original DataFrame.
+            pl.LazyFrame: The LazyFrame with constant columns dropped if `drop` is True,
+                          otherwise the original LazyFrame.
 
         Raises:
             ValueError: If constant columns are found and `drop` is False.
 
         Notes:
-            - This method works with both `pl.DataFrame` and `pl.LazyFrame`.
+            - This method works with both `pl.DataFrame` and `pl.LazyFrame`, the output is always lazy.
             - The method logs an error message if constant columns are found and `drop` is False.
             - The method logs an info message if constant columns are dropped or if no constant columns are found.
         """
-        if isinstance(self._df, pl.DataFrame):
-            const_cols = (
-                self._df.select(pl.col(independents).drop_nulls().unique().len())
-                .transpose(include_header=True)
-                .filter(pl.col("column_0") == 1)
-                .select(pl.col("column"))
-            )["column"].to_list()
-        else:
-            const_cols = (
-                self._df.select(pl.col(independents).drop_nulls().unique().len())
-                .collect()
-                .transpose(include_header=True)
-                .filter(pl.col("column_0") == 1)
-                .select(pl.col("column"))
-            )["column"].to_list()
+        lf = self._df.lazy()
+        n_unique = lf.select(pl.col(independents).drop_nulls().n_unique()).collect().row(0, named=True)
+        const_cols = [col for col in independents if n_unique[col] == 1]
         if const_cols:
             if not drop:
                 logger.error(
@@ -69,36 +62,10 @@ class MASFrame:
             new_independents = [col for col in independents if col not in const_cols]
             independents.clear()
             independents.extend(new_independents)
-            return self._df.drop(pl.col(const_cols))
-        return self._df
-
-    def check_grouped_independents_for_constants(
-        self, independents: list[str], dependent: str = None
-    ) -> list[str]:
-        if isinstance(self._df, pl.DataFrame):
-            const_cols = (
-                self._df.select(pl.col(independents).drop_nulls().unique().len())
-                .transpose(include_header=True)
-                .filter(pl.col("column_0") == 1)
-                .select(pl.col("column"))
-            )["column"].to_list()
-        else:
-            const_cols = (
-                self._df.select(pl.col(independents).drop_nulls().unique().len())
-                .collect()
-                .transpose(include_header=True)
-                .filter(pl.col("column_0") == 1)
-                .select(pl.col("column"))
-            )["column"].to_list()
-        if const_cols:
-            logger.warning(
-                f'Columns {",".join(const_cols)} are constants. Dropping from {dependent} analysis.'
-            )
-            non_consts = [col for col in independents if col not in const_cols]
-            return non_consts
-        return independents
+            return lf.drop(pl.col(const_cols))
+        return lf
 
-    def validate_dependents(self, dependents: list[str], quantitative: bool, min_cases: int) -> pl.DataFrame | pl.LazyFrame:
+    def validate_dependents(self, dependents: list[str], quantitative: bool, min_cases: int) -> pl.LazyFrame:
         """
         Validates and casts the dependent variables in the DataFrame.
 
@@ -107,81 +74,60 @@ class MASFrame:
         quantitative (bool): Flag indicating if the dependent variables are quantitative.
 
         Returns:
-        pl.DataFrame | pl.LazyFrame: The DataFrame with the dependent variables cast to the appropriate type.
+        pl.LazyFrame: The LazyFrame with the dependent variables cast to the appropriate type.
 
         Raises:
-        ValueError: If any of the dependent variables are not binary when quantitative is False.
+        ValueError: If any of the dependent variables are not binary or not coded as 0/1 when quantitative is False.
         """
+        lf = self._df.lazy()
         # Handle quantitative variables
         if quantitative:
-            if isinstance(self._df, pl.LazyFrame):
-                valid_dependents = (
-                    self._df
-                    .select(dependents)
-                    .count()
-                    .collect()
-                    .transpose(include_header=True)
-                    .filter(pl.col('column_0') >= min_cases)
-                )['column'].to_list()
-            else:
-                valid_dependents = (
-                    self._df
-                    .select(dependents)
-                    .count()
-                    .transpose(include_header=True)
-                    .filter(pl.col('column_0') >= min_cases)
-                )['column'].to_list()
-            if set(valid_dependents) != set(dependents):
+            counts = lf.select(pl.col(dependents).count()).collect(streaming=True).row(0, named=True)
+            valid_dependents = [col for col in dependents if counts[col] >= min_cases]
+            if len(valid_dependents) != len(dependents):
                 logger.warning(f'Dropping {len(dependents) - len(valid_dependents)} dependent variables from analysis due to having less than {min_cases} measurements.')
                 dependents.clear()
                 dependents.extend(valid_dependents)
-            return self._df.with_columns(pl.col(dependents).cast(pl.Float64))
-        
-        # Handle binary variables
-        if isinstance(self._df, pl.DataFrame):
-            not_binary = (
-                self._df.select(pl.col(dependents).unique().drop_nulls().n_unique())
-                .transpose(include_header=True)
-                .filter(pl.col("column_0") > 2)
-            )["column"].to_list()
-        else:
-            not_binary = (
-                self._df.select(pl.col(dependents).unique().drop_nulls().n_unique())
-                .collect()
-                .transpose(include_header=True)
-                .filter(pl.col("column_0") > 2)
-            )["column"].to_list()
+            return lf.with_columns(pl.col(dependents).cast(pl.Float64))
+
+        # Handle binary variables, all statistics come from a single one row aggregation
+        stats = (
+            lf.select(
+                *[pl.col(col).drop_nulls().n_unique().alias(f"__unique_{col}") for col in dependents],
+                *[pl.col(col).sum().alias(col) for col in dependents],
+                *[pl.col(col).count().alias(f"__n_{col}") for col in dependents],
+                *[(~pl.col(col).is_in([0, 1])).sum().alias(f"__coded_{col}") for col in dependents],
+            )
+            .collect(streaming=True)
+            .row(0, named=True)
+        )
+        not_binary = [col for col in dependents if stats[f"__unique_{col}"] > 2]
         if not_binary:
             logger.error(
                 f"Dependent variables {not_binary} are not binary. Please remove from analysis."
             )
             raise ValueError
-        if isinstance(self._df, pl.LazyFrame):
-                invalid_dependents = (
-                    self._df
-                    .select(dependents)
-                    .sum()
-                    .collect()
-                    .transpose(include_header=True)
-                    .filter(pl.col('column_0') < min_cases)
-                )['column'].to_list()
-        else:
-            invalid_dependents = (
-                self._df
-                .select(dependents)
-                .sum()
-                .transpose(include_header=True)
-                .filter(pl.col('column_0') < min_cases)
-            )['column'].to_list()
+        # A Boolean cast maps every non-zero value to True, other codings (e.g. PLINK 1/2) must not reach it
+        not_zero_one = [col for col in dependents if stats[f"__coded_{col}"] > 0]
+        if not_zero_one:
+            logger.error(
+                f"Dependent variables {not_zero_one} are not coded as 0 (control) and 1 (case). Please recode them before analysis."
+            )
+            raise ValueError
+        valid_dependents = [
+            col
+            for col in dependents
+            if stats[col] >= min_cases and stats[f"__n_{col}"] - stats[col] >= min_cases
+        ]
+        kept = set(valid_dependents)
+        invalid_dependents = [col for col in dependents if col not in kept]
         if invalid_dependents:
-            logger.warning(f'Dropping {len(invalid_dependents)} dependent variables from analysis due to having less than {min_cases} cases.')
-            valid_dependents = [col for col in dependents if col not in invalid_dependents]
+            logger.warning(f'Dropping {len(invalid_dependents)} dependent variables from analysis due to having less than {min_cases} cases or controls.')
             dependents.clear()
             dependents.extend(valid_dependents)
-            new_df = self._df.drop(pl.col(invalid_dependents))
-        else:
-            new_df = self._df
-        return new_df.with_columns(pl.col(dependents).cast(pl.UInt8))
+            lf = lf.drop(pl.col(invalid_dependents))
+        # Binary dependents are kept as bit-packed booleans until they reach the regression
+        return lf.with_columns(pl.col(dependents).cast(pl.Boolean))
 
     def handle_missing_values(self, method: str, independents: list[str]):
         """
@@ -198,8 +144,8 @@ class MASFrame:
 
         Returns:
         --------
-        pl.DataFrame
-            A new DataFrame with missing values handled according to the specified method.
+        pl.LazyFrame
+            A new LazyFrame with missing values handled according to the specified method.
 
         Notes:
         ------
@@ -209,23 +155,21 @@ class MASFrame:
           filled using the specified method, and a log message will indicate the columns
           and method used.
         """
+        lf = self._df.lazy()
         # If method is not drop, just fill the missing values with the specified method
         if method != "drop":
             logger.info(
                 f'Filling missing values in columns {",".join(independents)} with {method} method.'
             )
-            return self._df.with_columns(pl.col(independents).fill_null(strategy=method))
-        # If method is drop, drop rows with missing values in the specified independents
-        new_df = self._df.drop_nulls(subset=independents)
-        if isinstance(new_df, pl.DataFrame):
-            if new_df.height != self._df.height:
-                logger.info(f"Dropped {self._df.height - new_df.height} rows with missing values.")
-        else:
-            new_height = new_df.select(pl.len()).collect().item()
-            old_height = self._df.select(pl.len()).collect().item()
-            if new_height != old_height:
-                logger.info(f"Dropped {old_height - new_height} rows with missing values.")
-        return new_df
+            return lf.with_columns(pl.col(independents).fill_null(strategy=method))
+        # If method is drop, drop rows with missing values in the specified independents.
+        # Count the incomplete rows in the same pass used for the log message.
+        n_dropped = (
+            lf.select(pl.any_horizontal(pl.col(independents).is_null()).sum()).collect().item()
+        )
+        if n_dropped:
+            logger.info(f"Dropped {n_dropped} rows with missing values.")
+        return lf.drop_nulls(subset=independents)
 
     def category_to_dummy(
         self,
@@ -234,7 +178,7 @@ class MASFrame:
         independents: list[str],
         covariates: list[str],
         dependents: list[str],
-    ) -> pl.DataFrame | pl.LazyFrame:
+    ) -> pl.LazyFrame:
         """
         Converts categorical columns to dummy/one-hot encoded variables.
 
@@ -257,35 +201,35 @@ class MASFrame:
 
         Returns:
         --------
-        pl.DataFrame | pl.LazyFrame
-            The modified DataFrame or LazyFrame with dummy variables.
+        pl.LazyFrame
+            The modified LazyFrame with dummy variables.
         """
-        if isinstance(self._df, pl.DataFrame):
-            not_binary = (
-                self._df.select(pl.col(categorical_covariates).drop_nulls().n_unique())
-                .transpose(include_header=True)
-                .filter(pl.col("column_0") > 2)
-            )["column"].to_list()
-        else:
-            not_binary = (
-                self._df.select(pl.col(categorical_covariates).drop_nulls().n_unique())
-                .collect()
-                .transpose(include_header=True)
-                .filter(pl.col("column_0") > 2)
-            )["column"].to_list()
+        lf = self._df.lazy()
+        if not categorical_covariates:
+            return lf
+        # Only the sorted categories are collected, the first one is used as the reference level
+        categories = (
+            lf.select(pl.col(categorical_covariates).drop_nulls().unique().sort().implode())
+            .collect()
+            .row(0, named=True)
+        )
+        not_binary = [col for col in categorical_covariates if len(categories[col]) > 2]
         if not_binary:
             plural = len(not_binary) > 1
-            if isinstance(self._df, pl.LazyFrame):
-                logger.warning(
-                    f'Categorical column{"s" if plural else ""} {",".join(not_binary)} {"are" if plural else "is"} not binary. LazyFrame will be loaded to create dummy variables.'
-                )
-                cats = self._df.collect()
-            else:
-                logger.info(
-                    f'Categorical column{"s" if plural else ""} {",".join(not_binary)} {"are" if plural else "is"} not binary. Creating dummy variables.'
-                )
-                cats = self._df
-            dummy = cats.to_dummies(not_binary, drop_first=True)
+            logger.info(
+                f'Categorical column{"s" if plural else ""} {",".join(not_binary)} {"are" if plural else "is"} not binary. Creating dummy variables.'
+            )
+            # Replace each column in place by UInt8 indicators of its non-reference categories
+            dummy_exprs = []
+            for col in lf.collect_schema().names():
+                if col in not_binary:
+                    dummy_exprs.extend(
+                        (pl.col(col) == category).cast(pl.UInt8).alias(f"{col}_{category}")
+                        for category in categories[col][1:]
+                    )
+                else:
+                    dummy_exprs.append(pl.col(col))
+            dummy = lf.select(dummy_exprs)
             dummy_cols = dummy.collect_schema().names()
             # Update the lists in place to keep track of the independents and covariates
             independents.clear()
@@ -297,16 +241,12 @@ class MASFrame:
             new_binary_covars = [col for col in covariates if col not in original_covars]
             categorical_covariates.clear()
             categorical_covariates.extend(binary_covars + new_binary_covars)
-
-            if isinstance(self._df, pl.LazyFrame):
-                # Convert the dummy dataframe back to a LazyFrame for faster operations
-                dummy = pl.LazyFrame(dummy)
             return dummy
-        return self._df
+        return lf
 
     def transform_continuous(
         self, transform: str, independents: list[str], categorical_covariates: list[str]
-    ) -> pl.DataFrame | pl.LazyFrame:
+    ) -> pl.LazyFrame:
         """
         Transforms continuous independents in the DataFrame based on the specified transformation method.
 
@@ -322,144 +262,124 @@ class MASFrame:
 
         Returns:
         --------
-        pl.DataFrame | pl.LazyFrame
-            The DataFrame with transformed continuous independents.
+        pl.LazyFrame
+            The LazyFrame with transformed continuous independents.
 
         Notes:
         ------
-        - If the specified transformation method is not recognized, the original DataFrame is returned.
+        - If the specified transformation method is not recognized, the original LazyFrame is returned.
         - The method logs the transformation process for continuous independents.
         """
+        lf = self._df.lazy()
         continuous_independents = [col for col in independents if col not in categorical_covariates]
         if transform == "standard":
             logger.info(f"Standardizing continuous independents {continuous_independents}.")
-            return self._df.with_columns(pl.col(continuous_independents).transforms.standardize())
+            return lf.with_columns(pl.col(continuous_independents).transforms.standardize())
         elif transform == "min-max":
             logger.info(f"Min-max scaling continuous independents {continuous_independents}.")
-            return self._df.with_columns(pl.col(continuous_independents).transforms.min_max())
-        return self._df
+            return lf.with_columns(pl.col(continuous_independents).transforms.min_max())
+        return lf
 
-    def melt(
-        self, predictors: list[str], independents: list[str], dependents: list[str]
-    ) -> pl.DataFrame | pl.LazyFrame:
-        """
-        Transforms the DataFrame by melting specified columns into a long format suitable for modeling.
-
-        Args:
-            predictors (list[str]): List of predictor column names to be melted.
-            independents (list[str]): List of independent column names to be retained.
-            dependents (list[str]): List of dependent column names to be melted.
-
-        Returns:
-            pl.DataFrame | pl.LazyFrame: A DataFrame or LazyFrame with the melted structure, including a new column 'model_struct'
-            that contains a struct of predictor, predictor_value, covariates, dependent, and dependent_value.
-
-        Notes:
-            - The method first unpivots the DataFrame on the dependent columns, then drops any rows with null values in the
-              'dependent_value' column.
-            - It then unpivots the DataFrame again on the predictor columns.
-            - A new column 'model_struct' is created, which is a struct containing the predictor, predictor_value, covariates,
-              dependent, and dependent_value.
-            - The 'independents' list is modified in place to include 'predictor_value' and covariates.
-        """
-        covars = [col for col in independents if col not in predictors]
-        melted_df = (
-            self._df.unpivot(
-                index=independents,
-                on=dependents,
-                variable_name="dependent",
-                value_name="dependent_value",
-            )
-            .drop_nulls(subset=["dependent_value"])
-            .unpivot(
-                index=covars + ["dependent", "dependent_value"],
-                on=predictors,
-                variable_name="predictor",
-                value_name="predictor_value",
-            )
-            .with_columns(
-                pl.struct("predictor", "predictor_value", *covars, "dependent", "dependent_value").alias(
-                    "model_struct"
-                )
-            )
-        )
-        independents.clear()
-        independents.extend(["predictor_value", *covars])
-        return melted_df
-
-    def phewas_filter(self, is_phewas: bool, sex_col: str, drop: True) -> pl.DataFrame | pl.LazyFrame:
+    def phewas_filter(
+        self, is_phewas: bool, sex_col: str, dependents: list[str], drop: True
+    ) -> pl.LazyFrame:
+        lf = self._df.lazy()
         if not is_phewas:
-            return self._df
+            return lf
         sex_specific_codes = male_specific_codes + female_specific_codes
-        if sex_col not in self._df.collect_schema().names():
+        if sex_col not in lf.collect_schema().names():
             start_phrase = f"Column {sex_col} not found in PheWAS dataframe."
             if not drop:
                 logger.error(f"{start_phrase} Please provide the correct column name.")
                 raise ValueError
             logger.warning(f"{start_phrase} Sex specific phecodes will be dropped.")
-            return self._df.filter(~pl.col("dependent").is_in(sex_specific_codes))
-        # Otherwise, filter
-        condition = (
-            # Keep rows where sex is not male (1) OR phecode is not in female_specific_phecodes
-            ((pl.col(sex_col) != 0) | ~pl.col("dependent").is_in(female_specific_codes))
-            &
-            # AND keep rows where sex is not female (0) OR phecode is not in male_specific_phecodes
-            ((pl.col(sex_col) != 1) | ~pl.col("dependent").is_in(male_specific_codes))
+            dropped = [col for col in dependents if col in sex_specific_codes]
+            kept = [col for col in dependents if col not in sex_specific_codes]
+            dependents.clear()
+            dependents.extend(kept)
+            return lf.drop(dropped)
+        # Otherwise, null out the values of the opposite sex
+        female_codes = [col for col in dependents if col in female_specific_codes]
+        male_codes = [col for col in dependents if col in male_specific_codes]
+        return lf.with_columns(
+            # Keep values where sex is not male (1) for female specific phecodes
+            *[pl.when(pl.col(sex_col) != 0).then(pl.col(col)).alias(col) for col in female_codes],
+            # and values where sex is not female (0) for male specific phecodes
+            *[pl.when(pl.col(sex_col) != 1).then(pl.col(col)).alias(col) for col in male_codes],
         )
-        return self._df.filter(condition)
 
     def run_associations(
         self,
+        predictors: list[str],
         independents: list[str],
+        dependents: list[str],
         quantitative: bool,
         binary_model: str,
         linear_model: str,
         is_phewas: bool,
         min_cases: int,
-    ) -> pl.DataFrame | pl.LazyFrame:
+    ) -> pl.DataFrame:
+        lf = self._df.lazy()
+        if not dependents:
+            # validate_dependents can drop every dependent (e.g. min_cases above the case counts)
+            logger.error("No dependent variables left to test after validation.")
+            schema = {"predictor": pl.String, **firth_result_schema}
+            return pl.DataFrame(schema=schema).select(
+                [pl.col("dependent"), pl.col("predictor"), pl.all().exclude(["dependent", "predictor"])]
+            )
         if not quantitative:
             if binary_model == "firth":
-                reg_function = partial(
-                    polars_firth_regression,
-                    independents=independents,
-                    dependent_values="dependent_value",
-                    min_cases=min_cases,
-                )
                 start_time = time.time()
-                output = (
-                    self._df.group_by("dependent", "predictor")
-                    .agg(
-                        pl.col("model_struct")
-                        .map_batches(reg_function, return_dtype=pl.Struct, returns_scalar=True)
-                        .alias("result")
-                    )
-                    .unnest("result")
-                )
+                # The preprocessed frame stays wide, one column per dependent
+                wide = lf.select(*independents, *dependents).collect(streaming=True)
+                covariates = [col for col in independents if col not in predictors]
+                # Counts are shared by every predictor, polars takes them from the null bitmaps
+                total_counts = np.array(wide.select(pl.col(dependents).count()).row(0))
+                cases = np.array(wide.select(pl.col(dependents).sum()).row(0))
+                # Dependents can be missing for every sample (e.g. sex specific phecodes), they are
+                # reported as failed without reaching the regression
+                present = total_counts > 0
+                tested = [dependent for dependent, keep in zip(dependents, present) if keep]
+                untested = [dependent for dependent, keep in zip(dependents, present) if not keep]
+                # (dependents x samples), nulls become NaN
+                Y = wide.select(pl.col(tested).cast(pl.Float32)).to_numpy(order="fortran").T
+                failures = FailureCollector()
+                output = pl.concat(
+                    [
+                        polars_firth_regression(
+                            wide.select(pl.col(predictor, *covariates).cast(pl.Float32)).to_numpy(order="c"),
+                            Y,
+                            cases[present],
+                            total_counts[present],
+                            predictor=predictor,
+                            independents=[predictor, *covariates],
+                            dependents=tested,
+                            failures=failures,
+                        )
+                        for predictor in predictors
+                    ]
+                    + [no_samples_results(predictors, untested, failures)]
+                ).lazy()
                 if is_phewas:
                     # Add on the phecode definitions
-                    if isinstance(output, pl.LazyFrame):
-                        output = output.join(phecode_defs, left_on="dependent", right_on="phecode")
-                    else:
-                        output = output.join(
-                            phecode_defs.collect(), left_on="dependent", right_on="phecode"
-                        )
+                    output = output.join(phecode_defs, left_on="dependent", right_on="phecode")
             elif binary_model != "firth":
                 logger.warning(
                     "Other implementations have not be made yet. Please use 'firth' for binary models."
                 )
         else:
             logger.warning("Quantitative models have not been implemented yet.")
-        # All outputs will be named output
-        if isinstance(output, pl.LazyFrame):
-            output = output.collect()
+        # All outputs will be named output, the whole plan is only collected here
         output = (
             output.fill_nan(None)
             .select(
                 [pl.col("dependent"), pl.col("predictor"), pl.all().exclude(["dependent", "predictor"])]
             )
             .sort(["predictor", "pval"], nulls_last=True)
+            .collect(streaming=True)
         )
-        logger.info(f"Time taken for group_by: {time.time() - start_time:.2f}")
+        logger.info(f"Time taken for associations: {time.time() - start_time:.2f}")
+        failures.log_summary()
         return output
 
     # def run_associations_serial(
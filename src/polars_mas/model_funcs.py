@@ -1,93 +1,157 @@
 import polars as pl
-import polars_mas.mas_frame as pla
 import numpy as np
+from collections import Counter
+from dataclasses import dataclass, field
 from loguru import logger
-from firthlogist import FirthLogisticRegression
+from numba import parallel_chunksize
+from polars_mas.model_funcs_numba import firth_batch
+
+
+firth_result_schema = {
+    "dependent": pl.String,
+    "pval": pl.Float64,
+    "beta": pl.Float64,
+    "se": pl.Float64,
+    "OR": pl.Float64,
+    "ci_low": pl.Float64,
+    "ci_high": pl.Float64,
+    "cases": pl.Int64,
+    "controls": pl.Int64,
+    "total_n": pl.Int64,
+    "failed_reason": pl.String,
+}
+
+
+@dataclass
+class FailureCollector:
+    """
+    Tally of the regression failures and dropped constant columns of a run.
+
+    The failure reason of each dependent is already written to the output, so the per-dependent
+    log calls are replaced by a single summary once the associations are done.
+    """
+
+    failures: Counter = field(default_factory=Counter)
+    constant_columns: Counter = field(default_factory=Counter)
+
+    def log_summary(self) -> None:
+        if self.constant_columns:
+            logger.warning(
+                f"Constant columns dropped from regressions (column: count): {dict(self.constant_columns.most_common())}"
+            )
+        n_failures = self.failures.total()
+        if n_failures:
+            logger.info(f"{n_failures} regressions failed: {self.failures.most_common()}")
 
 
 def polars_firth_regression(
-    struct_col: pl.Struct, independents: list[str], dependent_values: str, min_cases: int
-) -> dict:
+    X: np.ndarray,
+    Y: np.ndarray,
+    cases: np.ndarray,
+    total_counts: np.ndarray,
+    predictor: str,
+    independents: list[str],
+    dependents: list[str],
+    failures: FailureCollector,
+) -> pl.DataFrame:
+    """
+    Perform Firth logistic regression for every dependent of a single predictor.
+
+    The independent matrix is shared by all dependents tested against a predictor and each
+    dependent only selects the samples where it is not missing.
+
+    Parameters:
+    X (np.ndarray): (samples x independents) float32 matrix, the predictor is the first column.
+    Y (np.ndarray): (dependents x samples) float32 matrix, NaN marks missing values.
+    cases (np.ndarray): Number of cases of each dependent.
+    total_counts (np.ndarray): Number of non-missing values of each dependent.
+    predictor (str): Name of the predictor tested.
+    independents (list[str]): Names of the columns of X.
+    dependents (list[str]): Names of the rows of Y.
+    failures (FailureCollector): Collects the failure reasons and dropped constant columns.
+
+    Returns:
+    pl.DataFrame: One row per dependent with the predictor, p-value, beta coefficient, standard
+                  error, odds ratio, confidence intervals, number of cases, controls, total number
+                  of observations, and failure reason if any.
+    """
+    # Dependents are handed to the kernel threads one at a time, fits vary a lot in cost (sample
+    # subsets, number of iterations) so an equal split leaves threads idle at the end of a batch
+    with parallel_chunksize(1):
+        beta, se, pval, ci_low, ci_high, active, status = firth_batch(X, Y, max_iter=1000, tol=1e-4)
+        # Refit in float64 where the float32 information matrix was not positive definite
+        retry = np.flatnonzero(status == 2)
+        if retry.size:
+            refit = firth_batch(X.astype(np.float64), Y[retry], max_iter=1000, tol=1e-4)
+            for arr, refit_arr in zip((beta, se, pval, ci_low, ci_high, active, status), refit):
+                arr[retry] = refit_arr
+    results = []
+    for j, dependent in enumerate(dependents):
+        # Need to have the full row to allow polars to output properly
+        output_struct = {
+            "predictor": predictor,
+            "dependent": dependent,
+            "pval": pval[j],
+            "beta": beta[j],
+            "se": se[j],
+            "OR": np.e ** beta[j],
+            "ci_low": ci_low[j],
+            "ci_high": ci_high[j],
+            "cases": cases[j],
+            "controls": total_counts[j] - cases[j],
+            "total_n": total_counts[j],
+            "failed_reason": "nan",
+        }
+        if not active[j].all():
+            failures.constant_columns.update(
+                col for col, keep in zip(independents, active[j]) if not keep
+            )
+        if status[j] == 1:
+            output_struct.update(
+                {
+                    "cases": None,
+                    "controls": None,
+                    "total_n": None,
+                    "failed_reason": "Predictor removed due to constant values",
+                }
+            )
+        elif status[j] == 2:
+            output_struct.update({"failed_reason": "Singular information matrix"})
+        elif status[j] == 3:
+            output_struct.update({"failed_reason": "Did not converge"})
+        if output_struct["failed_reason"] != "nan":
+            failures.failures[output_struct["failed_reason"]] += 1
+        results.append(output_struct)
+    return pl.DataFrame(results, schema={"predictor": pl.String, **firth_result_schema})
+
+
+def no_samples_results(
+    predictors: list[str], dependents: list[str], failures: FailureCollector
+) -> pl.DataFrame:
     """
-    Perform Firth logistic regression on a given dataset.
+    Failed rows for the dependents that are missing for every sample, which are not regressed.
 
     Parameters:
-    struct_col (pl.Struct): A Polars Struct column containing the data.
-    independents (list[str]): List of independent variable names.
-    dependent_values (str): Name of the dependent variable.
-    min_cases (int): Minimum number of cases required to perform the regression.
+    predictors (list[str]): Names of the predictors tested.
+    dependents (list[str]): Names of the dependents without any non-missing value.
+    failures (FailureCollector): Collects the failure reasons.
 
     Returns:
-    dict: A dictionary containing the results of the regression, including p-value,
-          beta coefficient, standard error, odds ratio, confidence intervals,
-          number of cases, controls, total number of observations, and failure reason if any.
+    pl.DataFrame: One row per predictor and dependent, in the schema of polars_firth_regression.
     """
-    # Need to have the full struct to allow polars to output properly
-    output_struct = {
-        "pval": float("nan"),
-        "beta": float("nan"),
-        "se": float("nan"),
-        "OR": float("nan"),
-        "ci_low": float("nan"),
-        "ci_high": float("nan"),
-        "cases": float("nan"),
-        "controls": float("nan"),
-        "total_n": float("nan"),
-        "failed_reason": "nan",
-    }
-    regframe = struct_col.struct.unnest()
-    dependent = regframe.select("dependent").unique().item()
-    predictor = regframe.select("predictor").unique().item()
-    X = regframe.select(independents)
-    non_consts = X.polars_mas.check_grouped_independents_for_constants(independents, dependent)
-    X = X.select(non_consts)
-    if independents[0] not in X.collect_schema().names():
-        logger.warning(f"Predictor {predictor} was removed due to constant values. Skipping analysis.")
-        output_struct.update(
-            {
-                "failed_reason": "Predictor removed due to constant values",
-            }
-        )
-        return output_struct
-    y = regframe.select(dependent_values).to_numpy().ravel()
-    cases = y.sum().astype(int)
-    total_counts = y.shape[0]
-    controls = total_counts - cases
-    output_struct.update(
+    failed_reason = "No non-missing samples"
+    if dependents:
+        failures.failures[failed_reason] += len(predictors) * len(dependents)
+    results = [
         {
-            "cases": cases,
-            "controls": controls,
-            "total_n": total_counts,
+            "predictor": predictor,
+            "dependent": dependent,
+            "cases": 0,
+            "controls": 0,
+            "total_n": 0,
+            "failed_reason": failed_reason,
         }
-    )
-    # if cases < min_cases or controls < min_cases:
-    #     logger.warning(
-    #         f"Too few cases for {dependent}: {cases} cases - {controls} controls. Skipping analysis."
-    #     )
-    #     output_struct.update(
-    #         {
-    #             "failed_reason": "Too few cases or controls",
-    #         }
-    #     )
-    #     return output_struct
-    try:
-        # We are only interested in the first predictor for the association test
-        fl = FirthLogisticRegression(max_iter=1000, test_vars=0)
-        fl.fit(X, y)
-        # input_vars = X.collect_schema().names()
-        output_struct.update(
-            {
-                "pval": fl.pvals_[0],
-                "beta": fl.coef_[0],
-                "se": fl.bse_[0],
-                "OR": np.e ** fl.coef_[0],
-                "ci_low": fl.ci_[0][0],
-                "ci_high": fl.ci_[0][1],
-                # "input_vars": ",".join(input_vars),
-            }
-        )
-        return output_struct
-    except Exception as e:
-        logger.error(f"Error in Firth regression for {dependent}: {e}")
-        output_struct.update({"failed_reason": str(e)})
-        return output_struct
+        for predictor in predictors
+        for dependent in dependents
+    ]
+    return pl.DataFrame(results, schema={"predictor": pl.String, **firth_result_schema})
@@ -0,0 +1,331 @@
+import math
+
+import numpy as np
+from numba import njit, prange
+
+# fastmath without the nnan/ninf flags, the kernels rely on NaN checks for missing dependents
+FASTMATH = {"nsz", "arcp", "contract", "afn", "reassoc"}
+# chi2.ppf(0.95, df=1), used for the 95% profile likelihood confidence interval
+CHI2_95 = 3.841458820694124
+
+
+@njit(fastmath=FASTMATH, cache=True)
+def _cholesky(A: np.ndarray) -> tuple[np.ndarray, bool]:
+    """Lower triangular Cholesky factor of A, flagging matrices that are not positive definite."""
+    k = A.shape[0]
+    L = np.zeros_like(A)
+    for j in range(k):
+        d = A[j, j]
+        for m in range(j):
+            d -= L[j, m] * L[j, m]
+        if not d > 0.0:
+            return L, False
+        L[j, j] = math.sqrt(d)
+        for i in range(j + 1, k):
+            s = A[i, j]
+            for m in range(j):
+                s -= L[i, m] * L[j, m]
+            L[i, j] = s / L[j, j]
+    return L, True
+
+
+@njit(fastmath=FASTMATH, cache=True)
+def _cho_solve(L: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Solve (L @ L.T) x = b from the Cholesky factor by forward and back substitution."""
+    k = L.shape[0]
+    x = b.astype(np.float64)
+    for i in range(k):
+        for m in range(i):
+            x[i] -= L[i, m] * x[m]
+        x[i] /= L[i, i]
+    for i in range(k - 1, -1, -1):
+        for m in range(i + 1, k):
+            x[i] -= L[m, i] * x[m]
+        x[i] /= L[i, i]
+    return x
+
+
+@njit(fastmath=FASTMATH, cache=True)
+def _tri_inv(L: np.ndarray) -> np.ndarray:
+    """Inverse of the lower triangular Cholesky factor, inv(L @ L.T) = _tri_inv(L).T @ _tri_inv(L)."""
+    k = L.shape[0]
+    L_inv = np.zeros_like(L)
+    for j in range(k):
+        L_inv[j, j] = 1.0 / L[j, j]
+        for i in range(j + 1, k):
+            s = 0.0
+            for m in range(j, i):
+                s -= L[i, m] * L_inv[m, j]
+            L_inv[i, j] = s / L[i, i]
+    return L_inv
+
+
+# The (samples x independents) products run in the precision of X (float32 by default), while
+# per-sample vectors, likelihood sums and the small (independents x independents) systems are float64.
+@njit(fastmath=FASTMATH, cache=True)
+def _predict(X: np.ndarray, coef: np.ndarray) -> np.ndarray:
+    eta = X @ coef.astype(X.dtype)
+    preds = np.empty(eta.shape[0])
+    for i in range(eta.shape[0]):
+        preds[i] = min(max(1.0 / (1.0 + math.exp(-eta[i])), 1e-15), 1 - 1e-15)
+    return preds
+
+
+@njit(fastmath=FASTMATH, cache=True)
+def _weighted(X: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    # Rows of X scaled by sqrt(weights), kept in the precision of X
+    XW = np.empty_like(X)
+    for i in range(X.shape[0]):
+        root_w = math.sqrt(weights[i])
+        for col in range(X.shape[1]):
+            XW[i, col] = X[i, col] * root_w
+    return XW
+
+
+@njit(fastmath=FASTMATH, cache=True)
+def _gram(XW: np.ndarray) -> np.ndarray:
+    return (XW.T @ XW).astype(np.float64)
+
+
+@njit(fastmath=FASTMATH, cache=True)
+def _xt_dot(X: np.ndarray, v: np.ndarray) -> np.ndarray:
+    return (X.T @ v.astype(X.dtype)).astype(np.float64)
+
+
+@njit(fastmath=FASTMATH, cache=True)
+def _penalized_loglik(y: np.ndarray, preds: np.ndarray, L: np.ndarray) -> float:
+    # Penalized log-likelihood, the Jeffreys penalty is 0.5 * logdet(I) = sum(log(diag(L)))
+    penalty = 0.0
+    for i in range(L.shape[0]):
+        penalty += math.log(L[i, i])
+    return np.sum(y * np.log(preds) + (1 - y) * np.log(1 - preds)) + penalty
+
+
+@njit(fastmath=FASTMATH, cache=True)
+def _loglikelihood(X: np.ndarray, y: np.ndarray, preds: np.ndarray) -> tuple[float, np.ndarray, bool]:
+    # Also returns the factor of the information matrix at preds for reuse by the caller
+    L, ok = _cholesky(_gram(_weighted(X, preds * (1 - preds))))
+    return _penalized_loglik(y, preds, L), L, ok
+
+
+@njit(fastmath=FASTMATH, cache=True)
+def _hat_diag(XW: np.ndarray, L: np.ndarray) -> np.ndarray:
+    # Diagonal of XW @ inv(I) @ XW.T, the squared row norms of XW @ inv(L).T
+    Z = XW @ _tri_inv(L).T.astype(XW.dtype)
+    return np.sum(Z * Z, axis=1).astype(np.float64)
+
+
+@njit(fastmath=FASTMATH, cache=True)
+def _firth_newton_raphson(
+    X: np.ndarray,
+    y: np.ndarray,
+    coef_init: np.ndarray,
+    max_iter: int,
+    max_stepsize: float,
+    tol: float,
+    mask: int,
+) -> tuple[np.ndarray, float, np.ndarray, int]:
+    """
+    Fit a Firth logistic regression by Newton-Raphson, following logistf/firthlogist.
+
+    The iterations start from coef_init. When mask >= 0 that coefficient is fixed at zero, giving
+    the null model of the penalized likelihood ratio test. As in logistf, the hat diagonal, the
+    score and the penalty of the null model still come from the full design and only the free
+    block of the information matrix is solved. Returns the coefficients, the penalized
+    log-likelihood, the Cholesky factor of the (full design) information matrix at the returned
+    coefficients and a status, using the codes of firth_batch (0 = converged, 2 = information
+    matrix not positive definite, 3 = did not converge within max_iter or step-halving failed).
+    """
+    k = X.shape[1]
+    free = np.array([col for col in range(k) if col != mask])
+    coef = coef_init.copy()
+    if mask >= 0:
+        coef[mask] = 0.0
+    loglik_new = -np.inf
+    L_new = np.zeros((k, k))
+    for iteration in range(1, max_iter + 1):
+        preds = _predict(X, coef)
+        XW = _weighted(X, preds * (1 - preds))
+        # The factor of the information matrix gives the hat diagonal, the penalty of the current
+        # log-likelihood and, for the full model, the step. After the first iteration it is the
+        # factor already computed for the accepted step.
+        if iteration == 1:
+            L, ok = _cholesky(_gram(XW))
+            if not ok:
+                return coef, np.nan, L, 2
+        else:
+            L = L_new
+        hat = _hat_diag(XW, L)
+        U_star = _xt_dot(X, y - preds + hat * (0.5 - preds))
+        if mask >= 0:
+            fisher_info_mtx = L @ L.T
+            L_free, ok = _cholesky(fisher_info_mtx[free][:, free])
+            if not ok:
+                return coef, np.nan, L, 2
+        else:
+            L_free = L
+        step_size = np.zeros(k)
+        step_size[free] = _cho_solve(L_free, U_star[free])
+        # Restrict to max_stepsize, then halve the step until the penalized likelihood improves
+        mx = np.max(np.abs(step_size)) / max_stepsize
+        if mx > 1:
+            step_size = step_size / mx
+        loglik = _penalized_loglik(y, preds, L)
+        full_step = np.linalg.norm(step_size)
+        coef_new = coef + step_size
+        loglik_new, L_new, ok_new = _loglikelihood(X, y, _predict(X, coef_new))
+        improved = ok_new and loglik_new >= loglik
+        for _ in range(30):
+            if improved:
+                break
+            step_size *= 0.5
+            coef_new = coef + step_size
+            loglik_new, L_new, ok_new = _loglikelihood(X, y, _predict(X, coef_new))
+            improved = ok_new and loglik_new >= loglik
+        if not improved:
+            # At the maximum the rounding of the likelihood can reject a step below tol, the
+            # current coefficients are then the converged fit
+            if iteration > 1 and full_step < tol:
+                return coef, loglik, L, 0
+            if not ok_new:
+                return coef, np.nan, L, 2
+            # Step-halving failed
+            return coef, loglik, L, 3
+        if iteration > 1 and np.linalg.norm(coef_new - coef) < tol:
+            return coef_new, loglik_new, L_new, 0
+        coef = coef_new
+    return coef, loglik_new, L_new, 3
+
+
+@njit(fastmath=FASTMATH, cache=True)
+def _profile_likelihood_bound(
+    X: np.ndarray,
+    y: np.ndarray,
+    fitted_coef: np.ndarray,
+    full_loglik: float,
+    side: int,
+    max_iter: int,
+    max_stepsize: float,
+    tol: float,
+) -> float:
+    # Profile likelihood confidence limit of the first coefficient (logistf's CLIP procedure)
+    LL0 = full_loglik - CHI2_95 / 2
+    coef = fitted_coef.copy()
+    for _ in range(max_iter):
+        preds = _predict(X, coef)
+        W = preds * (1 - preds)
+        XW = _weighted(X, W)
+        L, ok = _cholesky(_gram(XW))
+        if not ok:
+            return np.nan
+        loglik = _penalized_loglik(y, preds, L)
+        hat = _hat_diag(XW, L)
+        L, ok = _cholesky(_gram(_weighted(X, W * (1 + hat))))
+        if not ok:
+            return np.nan
+        U_star = _xt_dot(X, y - preds + hat * (0.5 - preds))
+        # U' inv(I) U and inv(I)[0, 0] from the inverse of the factor
+        L_inv = _tri_inv(L)
+        scaled_U = L_inv @ U_star
+        under_root = -2 * ((LL0 - loglik) - 0.5 * (scaled_U @ scaled_U)) / np.sum(L_inv[:, 0] ** 2)
+        if under_root > 0:
+            U_star[0] += side * math.sqrt(under_root)
+        step_size = _cho_solve(L, U_star)
+        mx = np.max(np.abs(step_size)) / max_stepsize
+        if mx > 1:
+            step_size = step_size / mx
+        coef += step_size
+        if abs(loglik - LL0) <= tol:
+            return coef[0]
+    return np.nan
+
+
+@njit(fastmath=FASTMATH, cache=True)
+def _non_constant(X: np.ndarray) -> np.ndarray:
+    active = np.empty(X.shape[1], dtype=np.bool_)
+    for col in range(X.shape[1]):
+        active[col] = X[:, col].max() != X[:, col].min()
+    return active
+
+
+@njit(fastmath=FASTMATH, cache=True)
+def _firth_single(
+    X: np.ndarray, y_all: np.ndarray, batch_active: np.ndarray, max_iter: int, tol: float
+) -> tuple[float, float, float, float, float, np.ndarray, int]:
+    # Regression of one dependent, samples where it is missing (NaN) are dropped
+    rows = np.flatnonzero(~np.isnan(y_all))
+    if rows.shape[0] == X.shape[0]:
+        # Nothing missing, the constant columns of the whole batch apply as is
+        X_rows = X
+        y = y_all.astype(np.float64)
+        active = batch_active.copy()
+    else:
+        X_rows = X[rows]
+        y = y_all[rows].astype(np.float64)
+        active = _non_constant(X_rows)
+    if not active[0]:
+        return np.nan, np.nan, np.nan, np.nan, np.nan, active, 1
+    cols = np.flatnonzero(active)
+    X_j = np.ones((rows.shape[0], cols.shape[0] + 1), dtype=X.dtype)
+    X_j[:, :-1] = X_rows[:, cols]
+    # Start from the intercept only fit (logit of the case rate, intercept is the last column)
+    coef_init = np.zeros(X_j.shape[1])
+    case_rate = np.mean(y)
+    if 0.0 < case_rate < 1.0:
+        coef_init[-1] = math.log(case_rate / (1 - case_rate))
+    coef, loglik, L, status = _firth_newton_raphson(X_j, y, coef_init, max_iter, 5.0, tol, -1)
+    if status == 2:
+        return np.nan, np.nan, np.nan, np.nan, np.nan, active, 2
+    L_inv = _tri_inv(L)
+    se = math.sqrt(np.sum(L_inv[:, 0] ** 2))
+    # The null model starts from the full fit, only the predictor coefficient is reset
+    _, null_loglik, _, null_status = _firth_newton_raphson(X_j, y, coef, max_iter, 5.0, tol, 0)
+    pval = np.nan
+    if null_status != 2:
+        # chi-squared (df=1) survival function of the likelihood ratio statistic
+        pval = math.erfc(math.sqrt(max(loglik - null_loglik, 0.0)))
+    ci_low = _profile_likelihood_bound(X_j, y, coef, loglik, -1, 100, 5.0, tol)
+    ci_high = _profile_likelihood_bound(X_j, y, coef, loglik, 1, 100, 5.0, tol)
+    # Estimates of a fit that did not converge are kept, flagged by the status
+    if status == 3 or null_status == 3:
+        return coef[0], se, pval, ci_low, ci_high, active, 3
+    return coef[0], se, pval, ci_low, ci_high, active, 0
+
+
+@njit(parallel=True, nogil=True, fastmath=FASTMATH, cache=True)
+def firth_batch(
+    X: np.ndarray, Y: np.ndarray, max_iter: int, tol: float
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Firth logistic regression of every dependent in Y against the shared independents X.
+
+    Parameters:
+    X (np.ndarray): (samples x independents) matrix, the first column is the predictor tested.
+                    An intercept is added for each model. Its dtype (float32 or float64) sets the
+                    precision of the (samples x independents) products.
+    Y (np.ndarray): (dependents x samples) binary matrix, NaN marks samples missing for a dependent.
+    max_iter (int): Maximum number of Newton-Raphson iterations.
+    tol (float): Convergence tolerance on the coefficient change.
+
+    Returns:
+    tuple: beta, se, pval (penalized likelihood ratio test), ci_low and ci_high (profile likelihood)
+           of the predictor for each dependent, the (dependents x independents) mask of non-constant
+           independents used in each model and a status per dependent (0 = fitted,
+           1 = constant predictor, 2 = information matrix not positive definite, 3 = the full or null
+           model did not converge).
+    """
+    n_pheno = Y.shape[0]
+    beta = np.empty(n_pheno)
+    se = np.empty(n_pheno)
+    pval = np.empty(n_pheno)
+    ci_low = np.empty(n_pheno)
+    ci_high = np.empty(n_pheno)
+    active = np.empty((n_pheno, X.shape[1]), dtype=np.bool_)
+    status = np.empty(n_pheno, dtype=np.int8)
+    # Constant columns are checked once for the batch, only dependents with missing values redo it
+    batch_active = _non_constant(X)
+    for j in prange(n_pheno):
+        beta[j], se[j], pval[j], ci_low[j], ci_high[j], active[j], status[j] = _firth_single(
+            X, Y[j], batch_active, max_iter, tol
+        )
+    return beta, se, pval, ci_low, ci_high, active, status
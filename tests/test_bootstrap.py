@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from polars_mas import _bootstrap
+from polars_mas._bootstrap import _build_parser, _limit_threads
+
+REQUIRED = ["-i", "in.csv", "-o", "out", "-p", "g1"]
+
+
+@pytest.mark.parametrize(
+    "argv, polars_threads, threads",
+    [
+        (["-pt", "3", "-th", "2"], 3, 2),
+        (["--polars-threads", "3", "--threads", "2"], 3, 2),
+        (["--polars-threads=3", "--threads=2"], 3, 2),
+        (["-pt=3", "-th=2"], 3, 2),
+        # Abbreviated long options, as accepted by argparse
+        (["--polars-thr", "3", "--thread", "2"], 3, 2),
+        ([], 4, None),
+    ],
+)
+def test_thread_arguments(monkeypatch, argv, polars_threads, threads):
+    monkeypatch.setattr(_bootstrap.os, "cpu_count", lambda: 4)
+    args = _build_parser().parse_args([*REQUIRED, *argv])
+    assert (args.polars_threads, args.threads) == (polars_threads, threads)
+
+
+@pytest.mark.parametrize(
+    "polars_threads, threads, expected",
+    [
+        (2, None, (2, 2)),  # kernel threads default to the Polars threads
+        (2, 1, (2, 1)),
+        (2, 3, (2, 2)),
+        (8, None, (4, 4)),  # limited to the CPU count
+        (8, 6, (4, 4)),
+    ],
+)
+def test_limit_threads(monkeypatch, polars_threads, threads, expected):
+    monkeypatch.setattr(_bootstrap.os, "cpu_count", lambda: 4)
+    args = _build_parser().parse_args([*REQUIRED, "-pt", str(polars_threads)])
+    args.threads = threads
+    _limit_threads(args)
+    assert (args.polars_threads, args.threads) == expected
+
+
+def test_bootstrap_does_not_import_polars():
+    # The thread counts have to be exported before polars and numba are imported
+    code = "import sys, polars_mas._bootstrap; print('polars' in sys.modules or 'numba' in sys.modules)"
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)}
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, env=env)
+    assert result.stdout.strip() == "False"
@@ -0,0 +1,38 @@
+import pytest
+
+from polars_mas.cli import _match_columns_to_indices
+
+COLUMNS = ["id", "g1", "sex", "age", "008", "250.2", "185"]
+
+
+@pytest.mark.parametrize(
+    "indices, expected",
+    [
+        ("1", ["g1"]),
+        ("2-4", ["sex", "age"]),  # the end of a range is exclusive
+        ("4-", ["008", "250.2", "185"]),
+        ("1,3,5-", ["g1", "age", "250.2", "185"]),
+        ("2-4,6", ["sex", "age", "185"]),
+        (",1,,3,", ["g1", "age"]),  # empty tokens are skipped
+        ("", []),
+    ],
+)
+def test_match_columns_to_indices(indices, expected):
+    assert _match_columns_to_indices(indices, COLUMNS) == expected
+
+
+@pytest.mark.parametrize(
+    "indices, message",
+    [
+        ("7", "Index 7 out of range"),
+        ("1,9", "Index 9 out of range"),
+        ("7-", "Start index 7 out of range"),
+        ("2-7", "End index 7 out of range"),
+        ("a-3", "Invalid index format"),
+        ("1:3", "Invalid index format"),
+        ("-3", "Invalid index format"),
+    ],
+)
+def test_match_columns_to_indices_errors(indices, message):
+    with pytest.raises(ValueError, match=message):
+        _match_columns_to_indices(indices, COLUMNS)
@@ -0,0 +1,83 @@
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+import polars_mas.mas_frame  # noqa: F401 registers the polars_mas namespace
+
+
+def _dependents_frame(**columns: list) -> pl.LazyFrame:
+    # Dependents are scanned as Float32, as in run_mas
+    return pl.LazyFrame(columns, schema={name: pl.Float32 for name in columns})
+
+
+def test_validate_dependents_casts_binary_to_boolean():
+    lf = _dependents_frame(a=[0.0, 1.0, None, 1.0, 0.0], b=[1.0, 0.0, 0.0, 1.0, None])
+    dependents = ["a", "b"]
+    out = lf.polars_mas.validate_dependents(dependents, quantitative=False, min_cases=1).collect()
+    assert dependents == ["a", "b"]
+    expected = pl.DataFrame(
+        {"a": [False, True, None, True, False], "b": [True, False, False, True, None]},
+        schema={"a": pl.Boolean, "b": pl.Boolean},
+    )
+    assert_frame_equal(out, expected)
+
+
+def test_validate_dependents_drops_too_few_cases_or_controls():
+    lf = _dependents_frame(a=[0.0, 1.0, 1.0, 0.0], rare=[0.0, 0.0, 0.0, 1.0], common=[1.0, 1.0, 1.0, 0.0])
+    dependents = ["a", "rare", "common"]
+    out = lf.polars_mas.validate_dependents(dependents, quantitative=False, min_cases=2).collect()
+    assert dependents == ["a"]
+    assert out.columns == ["a"]
+
+
+@pytest.mark.parametrize(
+    "values",
+    [
+        [1.0, 2.0, 2.0, 1.0],  # PLINK style 1 = control, 2 = case
+        [0.0, 1.0, 2.0, 1.0],  # not binary
+        [0.0, 0.5, 0.5, 0.0],
+    ],
+)
+def test_validate_dependents_rejects_codes_other_than_zero_one(values):
+    lf = _dependents_frame(ok=[0.0, 1.0, 0.0, 1.0], bad=values)
+    with pytest.raises(ValueError):
+        lf.polars_mas.validate_dependents(["ok", "bad"], quantitative=False, min_cases=1).collect()
+
+
+def test_validate_dependents_quantitative():
+    lf = _dependents_frame(a=[0.5, 1.5, 2.0], sparse=[None, None, 3.0])
+    dependents = ["a", "sparse"]
+    out = lf.polars_mas.validate_dependents(dependents, quantitative=True, min_cases=2).collect()
+    assert dependents == ["a"]
+    assert out.schema["a"] == pl.Float64
+
+
+def test_phewas_filter_masks_opposite_sex():
+    # sex: male = 0, female = 1. 185 is male specific, 174.11 female specific, 250.2 both
+    lf = pl.LazyFrame(
+        {"sex": [0, 1, 0, 1], "185": [1.0, 1.0, 0.0, 0.0], "174.11": [1.0, 1.0, 0.0, 0.0], "250.2": [1.0, 0.0, 1.0, 0.0]}
+    )
+    dependents = ["185", "174.11", "250.2"]
+    out = lf.polars_mas.phewas_filter(True, "sex", dependents, drop=True).collect()
+    assert dependents == ["185", "174.11", "250.2"]
+    # Rows are kept, only the values of the opposite sex become missing
+    assert out["185"].to_list() == [1.0, None, 0.0, None]
+    assert out["174.11"].to_list() == [None, 1.0, None, 0.0]
+    assert out["250.2"].to_list() == [1.0, 0.0, 1.0, 0.0]
+
+
+def test_phewas_filter_without_sex_column():
+    lf = pl.LazyFrame({"185": [1.0, 0.0], "174.11": [0.0, 1.0], "250.2": [1.0, 0.0]})
+    dependents = ["185", "174.11", "250.2"]
+    out = lf.polars_mas.phewas_filter(True, "sex", dependents, drop=True).collect()
+    assert dependents == ["250.2"]
+    assert out.columns == ["250.2"]
+    with pytest.raises(ValueError):
+        lf.polars_mas.phewas_filter(True, "sex", ["185", "250.2"], drop=False)
+
+
+def test_phewas_filter_not_phewas():
+    lf = pl.LazyFrame({"185": [1.0, 0.0], "sex": [1, 1]})
+    dependents = ["185"]
+    out = lf.polars_mas.phewas_filter(False, "sex", dependents, drop=True).collect()
+    assert_frame_equal(out, lf.collect())
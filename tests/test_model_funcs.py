@@ -0,0 +1,27 @@
+import polars as pl
+
+from polars_mas.model_funcs import FailureCollector, firth_result_schema, no_samples_results
+
+
+def test_no_samples_results():
+    failures = FailureCollector()
+    out = no_samples_results(["g1", "g2"], ["008", "185"], failures)
+    assert out.schema == pl.Schema({"predictor": pl.String, **firth_result_schema})
+    assert out.select("predictor", "dependent").rows() == [
+        ("g1", "008"),
+        ("g1", "185"),
+        ("g2", "008"),
+        ("g2", "185"),
+    ]
+    assert out["failed_reason"].unique().to_list() == ["No non-missing samples"]
+    assert out.select("cases", "controls", "total_n").sum().row(0) == (0, 0, 0)
+    assert out["pval"].is_null().all()
+    assert failures.failures == {"No non-missing samples": 4}
+
+
+def test_no_samples_results_empty():
+    failures = FailureCollector()
+    out = no_samples_results(["g1"], [], failures)
+    assert out.height == 0
+    assert out.columns == ["predictor", *firth_result_schema]
+    assert not failures.failures
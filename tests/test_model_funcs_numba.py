@@ -0,0 +1,90 @@
+import math
+from pathlib import Path
+
+import numpy as np
+import pytest
+from numpy.testing import assert_allclose
+
+import polars_mas
+from polars_mas.model_funcs_numba import _firth_newton_raphson, firth_batch
+
+# logistf::sex2 (shipped with the package), reference values from logistf
+SEX2 = np.loadtxt(Path(polars_mas.__file__).parent / "data" / "sex2.csv", delimiter=",", skiprows=1)
+LOGISTF_COEF = np.array([-1.10598131, -0.06881673, 2.26887464, -2.11140817, -0.78831694, 3.09601166])
+LOGISTF_CI = np.array(
+    [
+        [-1.9737884, -0.30742514],
+        [-0.9414363, 0.78920202],
+        [1.2730216, 3.43543273],
+        [-3.2608611, -1.11773495],
+        [-1.6080879, 0.01518468],
+        [0.7745682, 8.03029352],
+    ]
+)
+
+
+def _sex2_batch(predictor: int, dtype: type, max_iter: int = 1000) -> tuple[np.ndarray, ...]:
+    y, X = SEX2[:, 0], SEX2[:, 1:]
+    # The tested predictor goes first, the intercept is added by the kernel
+    X = np.column_stack([X[:, predictor], np.delete(X, predictor, axis=1)]).astype(dtype)
+    return firth_batch(X, y[None].astype(np.float32), max_iter, 1e-4)
+
+
+@pytest.mark.parametrize("predictor", range(6))
+@pytest.mark.parametrize("dtype, rtol", [(np.float64, 1e-4), (np.float32, 1e-3)])
+def test_matches_logistf(predictor, dtype, rtol):
+    beta, _, _, ci_low, ci_high, active, status = _sex2_batch(predictor, dtype)
+    assert status[0] == 0
+    assert active[0].all()
+    assert_allclose(beta[0], LOGISTF_COEF[predictor], rtol=rtol, atol=1e-4)
+    assert_allclose([ci_low[0], ci_high[0]], LOGISTF_CI[predictor], rtol=rtol, atol=1e-4)
+
+
+def test_matches_logistf_test_statistics():
+    _, se, pval, *_ = _sex2_batch(0, np.float64)
+    # logistf: age se 0.42366, likelihood ratio p 0.00614
+    assert_allclose(se[0], 0.42366, rtol=1e-4)
+    assert_allclose(pval[0], 0.006143, rtol=1e-3)
+
+
+def test_missing_and_constant():
+    y, X = SEX2[:, 0], SEX2[:, 1:]
+    Y = np.vstack([y, y]).astype(np.float32)
+    Y[1, :20] = np.nan
+    # Constant predictor within the non-missing samples of the second dependent only
+    predictor = np.where(np.arange(y.shape[0]) < 20, 1.0, 0.0)
+    beta, *_, status = firth_batch(
+        np.column_stack([predictor, X]), Y, 1000, 1e-4
+    )
+    assert status.tolist() == [0, 1]
+    assert np.isnan(beta[1])
+
+
+def test_not_converged():
+    beta, *_, status = _sex2_batch(0, np.float64, max_iter=2)
+    # Estimates of the last iteration are kept and flagged
+    assert status[0] == 3
+    assert np.isfinite(beta[0])
+
+
+@pytest.mark.parametrize("dtype, atol", [(np.float64, 1e-8), (np.float32, 1e-5)])
+def test_null_fit_independent_of_start(dtype, atol):
+    # Rare dependent (8 cases in 800 samples), where a stalling null fit depends on its start
+    rng = np.random.default_rng(1)
+    n = 800
+    X = np.column_stack(
+        [rng.normal(size=n), rng.integers(0, 2, n), rng.normal(size=n), np.ones(n)]
+    ).astype(dtype)
+    y = np.zeros(n)
+    y[rng.choice(n, 8, replace=False)] = 1
+    coef, loglik, _, status = _firth_newton_raphson(X, y, np.zeros(4), 1000, 5.0, 1e-4, -1)
+    assert status == 0
+    intercept_only = np.array([0.0, 0.0, 0.0, math.log(8 / 792)])
+    pvals = []
+    for coef_init in (np.zeros(4), intercept_only, coef):
+        _, null_loglik, _, status = _firth_newton_raphson(X, y, coef_init, 1000, 5.0, 1e-4, 0)
+        assert status == 0
+        pvals.append(math.erfc(math.sqrt(max(loglik - null_loglik, 0.0))))
+    # Constrained maximum from a direct optimisation of the penalized likelihood
+    assert_allclose(pvals, 0.4657171, atol=max(atol, 1e-7))
+    assert_allclose(pvals, pvals[0], atol=atol)